@@ -1,12 +1,12 @@
-import json
 from http.server import BaseHTTPRequestHandler
 
+from scripts.export_wochenbericht import json_dumps_bytes, json_loads
 from worker.export_service import handle_export_week_request, health_payload
 
 
 class handler(BaseHTTPRequestHandler):
     def _send_json(self, status: int, payload: dict):
-        body = json.dumps(payload).encode("utf-8")
+        body = json_dumps_bytes(payload)
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.send_header("Cache-Control", "no-store")
@@ -21,7 +21,7 @@ class handler(BaseHTTPRequestHandler):
         content_length = int(self.headers.get("content-length") or "0")
         raw_body = self.rfile.read(content_length) if content_length > 0 else b""
         try:
-            body = json.loads(raw_body.decode("utf-8")) if raw_body else None
+            body = json_loads(raw_body) if raw_body else None
         except Exception:
             body = None
 
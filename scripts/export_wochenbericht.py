@@ -1,20 +1,43 @@
 import argparse
 import json
-import math
 import os
+import threading
 import warnings
+from collections import OrderedDict
+from copy import copy
 from datetime import date, datetime, time
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 
 from openpyxl import load_workbook
+from openpyxl.cell.cell import Cell
+from openpyxl.utils import column_index_from_string
 
+try:
+    import orjson
+except ImportError:  # Optional speedup; the stdlib json module is used otherwise.
+    orjson = None
 
-warnings.filterwarnings("ignore", message="Conditional Formatting extension is not supported*")
-warnings.filterwarnings("ignore", message="Data Validation extension is not supported*")
-warnings.filterwarnings("ignore", message="wmf image format is not supported*")
+
+warnings.filterwarnings(
+    "ignore",
+    message="(Conditional Formatting extension|Data Validation extension|wmf image format) is not supported",
+)
 
 
 WEEKDAY_COLUMNS = ["H", "I", "J", "K", "L", "M", "N"]
+EXTRA_COLUMNS = ["Q", "R", "S", "T", "U", "V", "W", "X"]
+DATE_ROW = 9
+# Integer column indices resolved once, so the row loops can use ws.cell(row, column)
+# instead of building and parsing an A1 coordinate for every cell.
+COL_IDX = {col: column_index_from_string(col) for col in WEEKDAY_COLUMNS + EXTRA_COLUMNS + list("AEFGOP")}
+WEEKDAY_COL_IDX = [COL_IDX[col] for col in WEEKDAY_COLUMNS]
+EXTRA_COL_IDX = [COL_IDX[col] for col in EXTRA_COLUMNS]
+COL_A, COL_E, COL_F, COL_G, COL_O, COL_P = (COL_IDX[col] for col in "AEFGOP")
+COL_Q, COL_R, COL_S, COL_T, COL_U, COL_V, COL_W, COL_X = EXTRA_COL_IDX
+# Data-row columns that hold entry values; anything not written for a row is blanked.
+DATA_COL_IDX = [COL_A, COL_E, COL_F, *WEEKDAY_COL_IDX, *EXTRA_COL_IDX]
 DATA_ROW_START = 10
 DATA_ROW_END = 49
 
@@ -22,6 +45,66 @@ DATA_ROW_END = 49
 # entered (the form shows "max 3" only as a soft hint, not a hard cap).
 FAHRZEIT_LABEL = "Fahrzeiten"
 
+# Parsed templates kept per process, keyed by the caller-supplied template digest.
+TEMPLATE_CACHE_SIZE = 4
+
+
+# Row fields read by row_cell_values, with the defaults used for missing keys.
+ROW_DEFAULTS = {
+    "date": None,
+    "siteNameOrt": "",
+    "kind": None,
+    "fahrzeit": "",
+    "beginn": "",
+    "ende": "",
+    "pauseOverride": "",
+    "lohnType": "",
+    "ausloese": "",
+    "zulage": "",
+    "projektnummer": "",
+    "kabelschachtInfo": "",
+    "smNr": "",
+    "bauleiter": "",
+    "arbeitskollege": "",
+}
+_row_fields = itemgetter(*ROW_DEFAULTS)
+
+
+def _time_formulas(row: int):
+    return (
+        row,
+        (
+            f'=IF(E{row}="","",IF(E{row}<F{row},'
+            f'IF((F{row}-E{row})*24>9.5,0.75,IF((F{row}-E{row})*24>6,0.5,0)),'
+            f'IF((F{row}-E{row}+1)*24>9.5,0.75,IF((F{row}-E{row}+1)*24>6,0.5,0))))'
+        ),
+        f'=IF(E{row}="","",IF(E{row}<F{row},F{row}-E{row},F{row}-E{row}+1)*24)',
+        f'=IF(E{row}="","",IF(O{row}-G{row}>10,"Arbeitszeit prüfen",SUM(O{row}-G{row})))',
+    )
+
+
+# (row, G pause, O gross hours, P net hours) formulas for every data row, built once.
+TIME_FORMULAS = tuple(_time_formulas(row) for row in range(DATA_ROW_START, DATA_ROW_END + 1))
+
+
+def json_loads(data: str | bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
+def json_dumps_bytes(obj) -> bytes:
+    # orjson already produces UTF-8 bytes; avoid a decode/encode round trip on large responses.
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -30,13 +113,34 @@ def parse_args():
     return parser.parse_args()
 
 
+@lru_cache(maxsize=512)
 def parse_iso_date(value: str) -> date:
+    # Payload dates are always zero-padded "YYYY-MM-DD"; slice them instead of strptime.
+    # int() would also accept signs, spaces and underscores, so require plain ASCII digits.
+    if (
+        len(value) == 10
+        and value.isascii()
+        and value[4] == "-"
+        and value[7] == "-"
+        and value[0:4].isdigit()
+        and value[5:7].isdigit()
+        and value[8:10].isdigit()
+    ):
+        try:
+            return date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+        except ValueError:
+            pass
     return datetime.strptime(value, "%Y-%m-%d").date()
 
 
 def parse_time_value(value: str):
     if not value or not isinstance(value, str):
         return None
+    if len(value) == 5 and value[2] == ":":
+        try:
+            return time(hour=int(value[0:2]), minute=int(value[3:5]))
+        except ValueError:
+            return None
     try:
         hh, mm = value.split(":")
         return time(hour=int(hh), minute=int(mm))
@@ -44,32 +148,30 @@ def parse_time_value(value: str):
         return None
 
 
+_INF = float("inf")
+
+
 def parse_decimal(value: str):
     if value is None:
         return None
     if not isinstance(value, str):
         return value
-    txt = value.strip().replace(",", ".")
-    if not txt:
+    return _parse_decimal_text(value)
+
+
+@lru_cache(maxsize=1024)
+def _parse_decimal_text(value: str):
+    # Row texts repeat a lot across an export ("", "0,5", project numbers), so results are memoised.
+    stripped = value.strip()
+    if not stripped:
         return None
+    txt = stripped.replace(",", ".") if "," in stripped else stripped
     try:
         num = float(txt)
-        if math.isfinite(num):
-            return num
     except ValueError:
-        return value.strip()
-    return value.strip()
-
-
-def gross_hours(start: time | None, end: time | None):
-    if start is None or end is None:
-        return None
-    start_minutes = start.hour * 60 + start.minute
-    end_minutes = end.hour * 60 + end.minute
-    diff = end_minutes - start_minutes
-    if diff < 0:
-        diff += 24 * 60
-    return diff / 60.0
+        return stripped
+    # False for NaN and +/-inf, which are kept as text like before.
+    return num if -_INF < num < _INF else stripped
 
 
 def auto_pause_hours(hours: float | None):
@@ -103,7 +205,18 @@ def fahrzeit_hours(value):
     return float(parsed)
 
 
-def compute_day_cell_value(row: dict):
+def net_day_hours(start_minutes: int, end_minutes: int, pause_override: float | None):
+    # Numeric core of compute_day_cell_value; all string parsing happens in the caller.
+    diff = end_minutes - start_minutes
+    if diff < 0:
+        diff += 24 * 60
+    gross = diff / 60.0
+    pause = pause_override if pause_override is not None else (auto_pause_hours(gross) or 0.0)
+    return round(gross - pause, 2)
+
+
+def compute_day_cell_value(row: dict, start_t: time | None = None, end_t: time | None = None):
+    # Callers that already parsed "beginn"/"ende" pass them in; otherwise parse them here.
     override = row.get("dayHoursOverride")
     if isinstance(override, str):
         override_str = override.strip()
@@ -112,18 +225,19 @@ def compute_day_cell_value(row: dict):
     elif override is not None:
         return override
 
-    start = parse_time_value(row.get("beginn", ""))
-    end = parse_time_value(row.get("ende", ""))
-    gross = gross_hours(start, end)
-    if gross is None:
+    if start_t is None:
+        start_t = parse_time_value(row.get("beginn", ""))
+    if end_t is None:
+        end_t = parse_time_value(row.get("ende", ""))
+    if start_t is None or end_t is None:
         return None
 
     pause_override = parse_decimal(row.get("pauseOverride", ""))
-    if isinstance(pause_override, (int, float)):
-        return round(gross - float(pause_override), 2)
-
-    pause_auto = auto_pause_hours(gross) or 0.0
-    return round(gross - pause_auto, 2)
+    return net_day_hours(
+        start_t.hour * 60 + start_t.minute,
+        end_t.hour * 60 + end_t.minute,
+        float(pause_override) if isinstance(pause_override, (int, float)) else None,
+    )
 
 
 def write_header(ws, payload):
@@ -157,40 +271,86 @@ def clear_and_write_date_row(ws, payload):
         if row.get("projektnummer") == "G.014182.827.00" and row.get("date")
     }
 
-    for col in WEEKDAY_COLUMNS:
-        ws[f"{col}9"] = None
-
+    # Resolve all seven weekday cells first, then write each exactly once (None clears).
+    day_values = [None] * len(WEEKDAY_COL_IDX)
     for iso in all_week_dates:
         if iso not in segment_dates:
             continue
         d = parse_iso_date(iso)
-        iso_weekday = d.isoweekday()  # 1..7
-        col = WEEKDAY_COLUMNS[iso_weekday - 1]
-        ws[f"{col}9"] = f"{d.day}*" if iso in feiertag_dates else d.day
+        day_values[d.isoweekday() - 1] = f"{d.day}*" if iso in feiertag_dates else d.day
 
-
-def clear_data_rows(ws):
-    for row in range(DATA_ROW_START, DATA_ROW_END + 1):
-        ws[f"A{row}"] = None
-        ws[f"E{row}"] = None
-        ws[f"F{row}"] = None
-        for col in WEEKDAY_COLUMNS:
-            ws[f"{col}{row}"] = None
-        for col in ["Q", "R", "S", "T", "U", "V", "W", "X"]:
-            ws[f"{col}{row}"] = None
+    for col, value in zip(WEEKDAY_COL_IDX, day_values):
+        ws.cell(row=DATE_ROW, column=col).value = value
 
 
 def apply_time_formulas(ws):
-    for row in range(DATA_ROW_START, DATA_ROW_END + 1):
-        ws[f"G{row}"] = (
-            f'=IF(E{row}="","",IF(E{row}<F{row},'
-            f'IF((F{row}-E{row})*24>9.5,0.75,IF((F{row}-E{row})*24>6,0.5,0)),'
-            f'IF((F{row}-E{row}+1)*24>9.5,0.75,IF((F{row}-E{row}+1)*24>6,0.5,0))))'
-        )
-        ws[f"O{row}"] = f'=IF(E{row}="","",IF(E{row}<F{row},F{row}-E{row},F{row}-E{row}+1)*24)'
-        ws[f"P{row}"] = (
-            f'=IF(E{row}="","",IF(O{row}-G{row}>10,"Arbeitszeit prüfen",SUM(O{row}-G{row})))'
-        )
+    for row, pause_formula, gross_formula, net_formula in TIME_FORMULAS:
+        ws.cell(row=row, column=COL_G, value=pause_formula)
+        ws.cell(row=row, column=COL_O, value=gross_formula)
+        ws.cell(row=row, column=COL_P, value=net_formula)
+
+
+def row_cell_values(row_data: dict):
+    """Return the (column index, value) pairs written for one data row, in column order."""
+    (
+        iso, site_raw, kind, fahrzeit, beginn, ende, pause_raw, lohn_type, ausloese,
+        zulage_raw, projektnummer, kabelschacht, sm_nr, bauleiter, arbeitskollege,
+    ) = _row_fields({**ROW_DEFAULTS, **row_data})
+    cells = []
+    add = cells.append
+
+    site_raw = site_raw or ""
+    site_has = bool(site_raw.strip())
+    is_fahrzeit = kind == "fahrzeit"
+    travel_hrs = fahrzeit_hours(fahrzeit) if is_fahrzeit else None
+    # A dedicated travel row = an arbeitszeit line with no site name but a travel value.
+    # Its day column = travel hours; the day total still comes from the E/F bracket.
+    # Named rows keep their site name + normal day-hours; "Fahrzeiten" as a row name still works.
+    is_travel_row = travel_hrs is not None and not site_has
+    start_t = parse_time_value(beginn)
+    end_t = parse_time_value(ende)
+    day_cell_value = travel_hrs if is_travel_row else compute_day_cell_value(row_data, start_t, end_t)
+    weekday_col = None
+    if isinstance(iso, str):
+        try:
+            weekday_col = WEEKDAY_COL_IDX[parse_iso_date(iso).isoweekday() - 1]
+        except Exception:
+            weekday_col = None
+
+    if site_has:
+        add((COL_A, site_raw))
+    elif is_fahrzeit:
+        add((COL_A, FAHRZEIT_LABEL))
+    else:
+        add((COL_A, ""))
+    if start_t:
+        add((COL_E, start_t))
+    if end_t:
+        add((COL_F, end_t))
+
+    pause_override = parse_decimal(pause_raw)
+    if isinstance(pause_override, (int, float)):
+        add((COL_G, float(pause_override)))
+
+    if weekday_col and isinstance(day_cell_value, (int, float)) and day_cell_value >= 0:
+        add((weekday_col, float(day_cell_value)))
+    elif weekday_col and isinstance(day_cell_value, str) and day_cell_value.strip():
+        marker = day_cell_value.strip()
+        add((weekday_col, "x" if marker.lower() == "x" else marker))
+
+    add((COL_Q, lohn_type))
+    add((COL_R, ausloese))
+    zulage = parse_decimal(zulage_raw)
+    add((COL_S, zulage if zulage is not None else ""))
+    add((COL_T, projektnummer))
+    add((COL_U, kabelschacht))
+
+    sm_num = parse_decimal(sm_nr) if isinstance(sm_nr, str) else sm_nr
+    add((COL_V, sm_num if sm_num is not None else ""))
+
+    add((COL_W, bauleiter))
+    add((COL_X, arbeitskollege))
+    return cells
 
 
 def write_rows(ws, payload):
@@ -199,85 +359,100 @@ def write_rows(ws, payload):
     truncated = max(0, len(rows) - max_rows)
     rows_to_write = rows[:max_rows]
 
-    for idx, row_data in enumerate(rows_to_write):
-        row_no = DATA_ROW_START + idx
-        iso = row_data.get("date")
-        site_raw = row_data.get("siteNameOrt", "") or ""
-        site_has = bool(site_raw.strip())
-        travel_hrs = (
-            fahrzeit_hours(row_data.get("fahrzeit", ""))
-            if row_data.get("kind") == "fahrzeit"
-            else None
-        )
-        # A dedicated travel row = an arbeitszeit line with no site name but a travel value.
-        # Its day column = travel hours; the day total still comes from the E/F bracket.
-        # Named rows keep their site name + normal day-hours; "Fahrzeiten" as a row name still works.
-        is_travel_row = travel_hrs is not None and not site_has
-        day_cell_value = travel_hrs if is_travel_row else compute_day_cell_value(row_data)
-        weekday_col = None
-        if isinstance(iso, str):
-            try:
-                weekday_col = WEEKDAY_COLUMNS[parse_iso_date(iso).isoweekday() - 1]
-            except Exception:
-                weekday_col = None
-
-        if site_has:
-            ws[f"A{row_no}"] = site_raw
-        elif row_data.get("kind") == "fahrzeit":
-            ws[f"A{row_no}"] = FAHRZEIT_LABEL
-        else:
-            ws[f"A{row_no}"] = ""
-        start_t = parse_time_value(row_data.get("beginn", ""))
-        end_t = parse_time_value(row_data.get("ende", ""))
-        if start_t:
-            ws[f"E{row_no}"] = start_t
-        if end_t:
-            ws[f"F{row_no}"] = end_t
-
-        pause_override = parse_decimal(row_data.get("pauseOverride", ""))
-        if isinstance(pause_override, (int, float)):
-            ws[f"G{row_no}"] = float(pause_override)
-
-        if weekday_col and isinstance(day_cell_value, (int, float)) and day_cell_value >= 0:
-            ws[f"{weekday_col}{row_no}"] = float(day_cell_value)
-        elif weekday_col and isinstance(day_cell_value, str) and day_cell_value.strip():
-            marker = day_cell_value.strip()
-            ws[f"{weekday_col}{row_no}"] = "x" if marker.lower() == "x" else marker
-
-        ws[f"Q{row_no}"] = row_data.get("lohnType", "")
-        ws[f"R{row_no}"] = row_data.get("ausloese", "")
-        zulage = parse_decimal(row_data.get("zulage", ""))
-        ws[f"S{row_no}"] = zulage if zulage is not None else ""
-        ws[f"T{row_no}"] = row_data.get("projektnummer", "")
-        ws[f"U{row_no}"] = row_data.get("kabelschachtInfo", "")
-
-        sm_nr = row_data.get("smNr", "")
-        sm_num = parse_decimal(sm_nr) if isinstance(sm_nr, str) else sm_nr
-        ws[f"V{row_no}"] = sm_num if sm_num is not None else ""
-
-        ws[f"W{row_no}"] = row_data.get("bauleiter", "")
-        ws[f"X{row_no}"] = row_data.get("arbeitskollege", "")
+    # Single pass over all data rows: each cell is written once, either with the
+    # entry value or None, instead of clearing every row first and then overwriting.
+    for idx, row_no in enumerate(range(DATA_ROW_START, DATA_ROW_END + 1)):
+        values = dict(row_cell_values(rows_to_write[idx])) if idx < len(rows_to_write) else {}
+        for col in DATA_COL_IDX:
+            # ws.cell(..., value=None) leaves the value untouched, so assign explicitly.
+            ws.cell(row=row_no, column=col).value = values.pop(col, None)
+        for col, value in values.items():
+            ws.cell(row=row_no, column=col, value=value)
 
     return len(rows_to_write), truncated
 
 
-def export_payload_wrapper(data: dict, output_path: Path):
-    template_path = data["templatePath"]
-    payload = data["payload"]
-
+class CachedTemplate:
+    """A parsed template workbook plus a snapshot of its pristine sheet cells.
+
+    Exports render into the shared workbook and restore the snapshot afterwards,
+    so the template XML is parsed only once per process instead of per segment.
+    """
+
+    def __init__(self, template_path: str | Path):
+        self.wb = load_template_workbook(template_path)
+        self.ws = self.wb["Wochenbericht"]
+        self.lock = threading.Lock()
+        self.snapshot = {
+            key: (cell._value, cell.data_type, copy(cell._style))
+            for key, cell in self.ws._cells.items()
+            if isinstance(cell, Cell)
+        }
+
+    def restore(self):
+        cells = self.ws._cells
+        for key in [key for key in cells if key not in self.snapshot and isinstance(cells[key], Cell)]:
+            del cells[key]
+        for key, (value, data_type, style) in self.snapshot.items():
+            cell = cells[key]
+            cell._value = value
+            cell.data_type = data_type
+            cell._style = copy(style)
+
+
+_template_cache: "OrderedDict[str, CachedTemplate]" = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+
+def get_cached_template(template_key: str, template_path: str | Path) -> CachedTemplate:
+    with _template_cache_lock:
+        cached = _template_cache.get(template_key)
+        if cached is not None:
+            _template_cache.move_to_end(template_key)
+            return cached
+
+    cached = CachedTemplate(template_path)
+    with _template_cache_lock:
+        cached = _template_cache.setdefault(template_key, cached)
+        _template_cache.move_to_end(template_key)
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return cached
+
+
+def load_template_workbook(template_path: str | Path):
+    # Loaded unmodified so the template's conditional formatting and data validation rules survive.
     wb = load_workbook(template_path)
     if "Wochenbericht" not in wb.sheetnames:
         raise RuntimeError("Sheet 'Wochenbericht' not found in template")
+    return wb
+
+
+def render_workbook(wb, payload: dict, output_path: Path):
     ws = wb["Wochenbericht"]
 
     write_header(ws, payload)
     clear_and_write_date_row(ws, payload)
-    clear_data_rows(ws)
     apply_time_formulas(ws)
     rows_written, rows_truncated = write_rows(ws, payload)
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
     wb.save(output_path)
+    return rows_written, rows_truncated
+
+
+def run_export(template_path: str | Path, payload: dict, output_path: Path, template_key: str | None = None):
+    """Render one report in-process; template_key (a digest of the template bytes) enables workbook reuse."""
+    if template_key:
+        cached = get_cached_template(template_key, template_path)
+        with cached.lock:
+            try:
+                rows_written, rows_truncated = render_workbook(cached.wb, payload, output_path)
+            finally:
+                cached.restore()
+    else:
+        wb = load_template_workbook(template_path)
+        rows_written, rows_truncated = render_workbook(wb, payload, output_path)
 
     result = {
       "output_path": str(output_path),
@@ -293,8 +468,12 @@ def export_payload_wrapper(data: dict, output_path: Path):
     return result
 
 
+def export_payload_wrapper(data: dict, output_path: Path):
+    return run_export(data["templatePath"], data["payload"], output_path, data.get("templateKey"))
+
+
 def export_payload_file(payload_path: Path, output_path: Path):
-    data = json.loads(payload_path.read_text(encoding="utf-8"))
+    data = json_loads(payload_path.read_bytes())
     return export_payload_wrapper(data, output_path)
 
 
@@ -304,7 +483,7 @@ def main():
     output_path = Path(args.output)
 
     result = export_payload_file(payload_path, output_path)
-    print(json.dumps(result))
+    print(json_dumps(result))
 
 
 if __name__ == "__main__":
@@ -1,8 +1,39 @@
+import os
+
 from flask import Flask, jsonify, request
-from worker.export_service import handle_export_week_request, health_payload
+from flask.json.provider import DefaultJSONProvider
+
+from worker.export_service import ensure_pdf_server, handle_export_week_request, health_payload
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; Flask's stock JSON provider is used otherwise.
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Parses request bodies and serialises responses with orjson."""
+
+    def dumps(self, obj, **kwargs):
+        # Dates and non-native types (Decimal, dataclasses, ...) go through Flask's default
+        # hook, so responses match the stock provider.
+        return orjson.dumps(
+            obj,
+            default=kwargs.get("default", self.default),
+            option=orjson.OPT_PASSTHROUGH_DATETIME,
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 
 app = Flask(__name__)
+if orjson is not None:
+    # Without orjson the stock DefaultJSONProvider is kept unchanged.
+    app.json = OrjsonProvider(app)
+
+# Boot the LibreOffice daemon (if configured) without blocking worker startup.
+ensure_pdf_server(wait=False)
 
 
 @app.get("/health")
@@ -1,11 +1,19 @@
 import base64
+import binascii
+import hashlib
+import multiprocessing
 import os
+import socket
 import subprocess
 import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from typing import Mapping
 
-from scripts.export_wochenbericht import export_payload_wrapper
+from scripts.export_wochenbericht import run_export
 
 
 def _get_token_from_headers(authorization: str | None, token_header: str | None):
@@ -25,13 +33,226 @@ def authorize_request(authorization: str | None = None, token_header: str | None
     return None
 
 
+# Base64 is processed in blocks: 57 KiB of raw bytes (a multiple of 3) encodes to
+# exactly 76 KiB of text (a multiple of 4), so blocks concatenate without padding.
+B64_RAW_CHUNK = 57 * 1024
+B64_TEXT_CHUNK = 76 * 1024
+
+
+def _b64_encode_file(path: Path) -> str:
+    encoded = bytearray()
+    with path.open("rb") as fh:
+        while chunk := fh.read(B64_RAW_CHUNK):
+            encoded.extend(base64.b64encode(chunk))
+    return encoded.decode("ascii")
+
+
+def _b64_decode_to_file(data: str, path: Path) -> str:
+    """Decode base64 text into path block by block; returns a digest of the decoded bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    with path.open("wb") as fh:
+        for start in range(0, len(data), B64_TEXT_CHUNK):
+            chunk_text = data[start:start + B64_TEXT_CHUNK]
+            # Padding is only valid at the very end; per-block decoding would accept it mid-stream.
+            if start + B64_TEXT_CHUNK < len(data) and "=" in chunk_text:
+                raise binascii.Error("Excess data after padding")
+            chunk = base64.b64decode(chunk_text, validate=True)
+            digest.update(chunk)
+            fh.write(chunk)
+    return digest.hexdigest()
+
+
+_segment_pool = None
+_segment_pool_lock = threading.Lock()
+_segment_pool_unavailable = False
+
+
+def _segment_pool_size():
+    # Opt-in: each child imports openpyxl and keeps its own template cache, and
+    # os.cpu_count() ignores container CPU quotas, so the default stays sequential.
+    try:
+        return max(1, int(os.environ.get("EXPORT_SEGMENT_PROCESSES", "1").strip() or "1"))
+    except ValueError:
+        return 1
+
+
+def _get_segment_pool():
+    """Lazily start one long-lived process pool so each child keeps its template cache warm."""
+    global _segment_pool, _segment_pool_unavailable
+    with _segment_pool_lock:
+        if _segment_pool is None and not _segment_pool_unavailable and _segment_pool_size() > 1:
+            try:
+                _segment_pool = ProcessPoolExecutor(
+                    max_workers=_segment_pool_size(),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            except (OSError, NotImplementedError, ImportError):
+                # No working multiprocessing primitives (e.g. serverless runtimes).
+                _segment_pool_unavailable = True
+        return _segment_pool
+
+
+def _mark_segment_pool_broken():
+    # A pool that broke once is likely to break again; stop paying the spawn cost.
+    global _segment_pool, _segment_pool_unavailable
+    with _segment_pool_lock:
+        pool, _segment_pool = _segment_pool, None
+        _segment_pool_unavailable = True
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _render_segment(task: tuple):
+    template_path, template_key, payload, xlsx_path = task
+    return run_export(template_path, payload, xlsx_path, template_key)
+
+
+def _render_segments(tasks: list):
+    """Render segments in parallel when more than one is requested; results keep task order."""
+    pool = _get_segment_pool() if len(tasks) > 1 else None
+    if pool is not None:
+        try:
+            return list(pool.map(_render_segment, tasks))
+        except BrokenProcessPool:
+            _mark_segment_pool_broken()
+    return [_render_segment(task) for task in tasks]
+
+
 def health_payload():
     return {"ok": True}
 
 
-def _try_pdf_convert(xlsx_path: Path):
-    if os.environ.get("ENABLE_PDF_EXPORT", "0").strip() not in {"1", "true", "TRUE"}:
-        return None, "PDF export disabled on worker."
+def _pdf_export_enabled():
+    return os.environ.get("ENABLE_PDF_EXPORT", "0").strip() in {"1", "true", "TRUE"}
+
+
+_pdf_server = None
+_pdf_server_lock = threading.Lock()
+
+
+def _pdf_server_address():
+    port = os.environ.get("PDF_SERVER_PORT", "").strip()
+    if not port.isdigit():
+        return None
+    return os.environ.get("PDF_SERVER_HOST", "127.0.0.1").strip() or "127.0.0.1", int(port)
+
+
+def _env_seconds(name: str, default: float):
+    try:
+        value = float(os.environ.get(name, "").strip() or default)
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def _stop_pdf_server():
+    """Kill a hung daemon together with the soffice process it started."""
+    global _pdf_server
+    with _pdf_server_lock:
+        proc, _pdf_server = _pdf_server, None
+    if proc is None or proc.poll() is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, 9)
+        else:
+            proc.kill()
+        proc.wait(timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+
+def _pdf_server_ready(address: tuple[str, int]):
+    try:
+        with socket.create_connection(address, timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def ensure_pdf_server(wait: bool = True):
+    """Start (or restart after a crash) the long-running unoserver/LibreOffice daemon.
+
+    Only active when PDF export is enabled and PDF_SERVER_PORT is set. A daemon that
+    another worker process already started on the same port is reused.
+    """
+    global _pdf_server
+    address = _pdf_server_address()
+    if address is None or not _pdf_export_enabled():
+        return False
+    if _pdf_server_ready(address):
+        return True
+
+    with _pdf_server_lock:
+        if _pdf_server is None or _pdf_server.poll() is not None:
+            host, port = address
+            try:
+                _pdf_server = subprocess.Popen(
+                    [os.environ.get("UNOSERVER_BIN", "unoserver"), "--interface", host, "--port", str(port)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    # Own process group, so a hung daemon can be killed along with soffice.
+                    start_new_session=True,
+                )
+            except OSError:
+                _pdf_server = None
+                return False
+
+    if not wait:
+        return False
+    deadline = time.monotonic() + _env_seconds("PDF_SERVER_STARTUP_TIMEOUT", 30)
+    while time.monotonic() < deadline:
+        if _pdf_server_ready(address):
+            return True
+        if _pdf_server is None or _pdf_server.poll() is not None:
+            return _pdf_server_ready(address)
+        time.sleep(0.25)
+    return False
+
+
+def _try_pdf_server_convert(xlsx_paths: list[Path]):
+    if not ensure_pdf_server():
+        return {}
+    host, port = _pdf_server_address()
+    pdf_paths = {}
+    for xlsx_path in xlsx_paths:
+        pdf_path = xlsx_path.with_suffix(".pdf")
+        try:
+            proc = subprocess.run(
+                [
+                    os.environ.get("UNOCONVERT_BIN", "unoconvert"),
+                    "--host", host,
+                    "--port", str(port),
+                    "--convert-to", "pdf",
+                    str(xlsx_path),
+                    str(pdf_path),
+                ],
+                capture_output=True,
+                text=True,
+                check=False,
+                timeout=_env_seconds("PDF_SERVER_CONVERT_TIMEOUT", 60),
+            )
+        except subprocess.TimeoutExpired:
+            # The daemon can hang while still accepting connections; restart it on the
+            # next request and let this one fall back to the batched soffice run.
+            _stop_pdf_server()
+            return {}
+        except OSError:
+            return {}
+        if proc.returncode == 0 and pdf_path.exists():
+            pdf_paths[xlsx_path] = pdf_path
+    return pdf_paths
+
+
+def _try_pdf_convert(xlsx_paths: list[Path]):
+    """Convert all reports with a single soffice run; returns ({xlsx_path: pdf_path}, warning)."""
+    if not _pdf_export_enabled():
+        return {}, "PDF export disabled on worker."
+
+    # Prefer the persistent daemon; cold-starting soffice per request costs seconds.
+    pdf_paths = _try_pdf_server_convert(xlsx_paths)
+    if len(pdf_paths) == len(xlsx_paths):
+        return pdf_paths, None
 
     configured = os.environ.get("SOFFICE_PATH", "").strip()
     candidates = [c for c in [
@@ -43,22 +264,28 @@ def _try_pdf_convert(xlsx_path: Path):
         r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
     ] if c]
 
+    # soffice accepts many input files per run, so its startup cost is paid once per request.
+    outdir = xlsx_paths[0].parent
     for candidate in candidates:
         try:
             proc = subprocess.run(
-                [candidate, "--headless", "--convert-to", "pdf", "--outdir", str(xlsx_path.parent), str(xlsx_path)],
+                [candidate, "--headless", "--convert-to", "pdf", "--outdir", str(outdir), *map(str, xlsx_paths)],
                 capture_output=True,
                 text=True,
                 check=False,
             )
             if proc.returncode == 0:
-                pdf_path = xlsx_path.with_suffix(".pdf")
-                if pdf_path.exists():
-                    return pdf_path, None
+                pdf_paths = {
+                    xlsx_path: xlsx_path.with_suffix(".pdf")
+                    for xlsx_path in xlsx_paths
+                    if xlsx_path.with_suffix(".pdf").exists()
+                }
+                if pdf_paths:
+                    return pdf_paths, None
         except Exception:
             continue
 
-    return None, "PDF export requires LibreOffice (soffice) on worker."
+    return {}, "PDF export requires LibreOffice (soffice) on worker."
 
 
 def _validate_export_request(body: object):
@@ -78,16 +305,27 @@ def _validate_export_request(body: object):
     if not isinstance(segments, list) or not segments:
         return None, {"error": "segments is required"}, 400
 
-    try:
-        template_bytes = base64.b64decode(template_b64, validate=True)
-    except Exception:
-        return None, {"error": "templateBase64 is invalid"}, 400
+    # Segment checks run here, before any template decoding or disk I/O.
+    jobs = []
+    for idx, segment in enumerate(segments):
+        if not isinstance(segment, dict):
+            return None, {"error": f"Invalid segment at index {idx}"}, 400
+
+        base_name = str(segment.get("baseName") or f"segment_{idx}")
+        payload = segment.get("payload")
+        if not isinstance(payload, dict):
+            return None, {"error": f"Missing payload for segment '{base_name}'"}, 400
+
+        file_base_name = Path(base_name).name or f"segment_{idx}"
+        # Segments are all rendered before any file is read back, so names such as
+        # "a/x" and "b/x" need the index prefix to keep their outputs apart.
+        jobs.append((segment, base_name, f"{idx}_{file_base_name}.xlsx", payload))
 
     return {
         "format": fmt,
-        "template_bytes": template_bytes,
+        "template_b64": template_b64,
         "template_filename": Path(template_filename).name or "template.xlsx",
-        "segments": segments,
+        "jobs": jobs,
     }, None, None
 
 
@@ -105,9 +343,8 @@ def handle_export_week_request(
         return error_body, error_status
 
     fmt = request_data["format"]
-    template_bytes = request_data["template_bytes"]
+    template_b64 = request_data["template_b64"]
     template_filename = request_data["template_filename"]
-    segments = request_data["segments"]
 
     reports = []
 
@@ -115,35 +352,36 @@ def handle_export_week_request(
         with tempfile.TemporaryDirectory(prefix="wb_worker_") as tmp_dir:
             tmp = Path(tmp_dir)
             template_path = tmp / template_filename
-            template_path.write_bytes(template_bytes)
-
-            for idx, segment in enumerate(segments):
-                if not isinstance(segment, dict):
-                    return {"error": f"Invalid segment at index {idx}"}, 400
-
-                base_name = str(segment.get("baseName") or f"segment_{idx}")
-                payload = segment.get("payload")
-                if not isinstance(payload, dict):
-                    return {"error": f"Missing payload for segment '{base_name}'"}, 400
-
-                file_base_name = Path(base_name).name or f"segment_{idx}"
-                xlsx_path = tmp / f"{file_base_name}.xlsx"
-                py_result = export_payload_wrapper(
-                    {
-                        "templatePath": str(template_path),
-                        "payload": payload,
-                    },
-                    xlsx_path,
-                )
+            try:
+                # The digest lets the exporter reuse its parsed copy of this template.
+                template_key = _b64_decode_to_file(template_b64, template_path)
+            except (binascii.Error, ValueError):
+                return {"error": "templateBase64 is invalid"}, 400
+
+            jobs = [
+                (segment, base_name, tmp / xlsx_name, payload)
+                for segment, base_name, xlsx_name, payload in request_data["jobs"]
+            ]
+
+            py_results = _render_segments([
+                (template_path, template_key, payload, xlsx_path)
+                for _segment, _base_name, xlsx_path, payload in jobs
+            ])
+
+            pdf_paths, pdf_warning = {}, None
+            if fmt in {"pdf", "both"}:
+                pdf_paths, pdf_warning = _try_pdf_convert([xlsx_path for _s, _b, xlsx_path, _p in jobs])
+
+            for (segment, base_name, xlsx_path, _payload), py_result in zip(jobs, py_results):
                 warnings = list(py_result.get("warnings") or [])
 
                 pdf_b64 = None
                 if fmt in {"pdf", "both"}:
-                    pdf_path, pdf_warning = _try_pdf_convert(xlsx_path)
-                    if pdf_path and pdf_path.exists():
-                        pdf_b64 = base64.b64encode(pdf_path.read_bytes()).decode("ascii")
-                    elif pdf_warning:
-                        warnings.append(pdf_warning)
+                    pdf_path = pdf_paths.get(xlsx_path)
+                    if pdf_path:
+                        pdf_b64 = _b64_encode_file(pdf_path)
+                    else:
+                        warnings.append(pdf_warning or "PDF conversion failed on worker.")
 
                 reports.append({
                     "baseName": base_name,
@@ -156,7 +394,7 @@ def handle_export_week_request(
                     "warnings": warnings,
                     "rowsWritten": py_result.get("rows_written"),
                     "rowsTruncated": py_result.get("rows_truncated"),
-                    "xlsxBase64": base64.b64encode(xlsx_path.read_bytes()).decode("ascii"),
+                    "xlsxBase64": _b64_encode_file(xlsx_path),
                     "pdfBase64": pdf_b64,
                 })
 